@@ -1,21 +1,23 @@
 import os
 import copy
+import hashlib
 import datetime
 import numpy as np
 import pandas as pd
 import pickle
+import shutil
+import tempfile
+import torch
 
-from dateutil.parser import parse
-from sklearn.metrics.pairwise import cosine_similarity
-from scipy.stats import pearsonr
+from concurrent.futures import ThreadPoolExecutor
+from numpy.lib.stride_tricks import as_strided
 
-from ..preprocess.time_utils import is_work_day_china, is_work_day_america, is_valid_date
+from ..preprocess.time_utils import is_work_day_china, is_work_day_america, is_valid_date, slot_hour_and_weekday
 from ..preprocess import MoveSample, SplitData, ST_MoveSample, Normalizer
 from ..model_unit import GraphBuilder
 
 from ..preprocess.preprocessor import *
 from .dataset import DataSet
-from ..utils.encode_onehot import one_hot
 
 class NodeTrafficLoader(object):
     """The data loader that extracts and processes data from a :obj:`DataSet` object.
@@ -54,26 +56,49 @@ class NodeTrafficLoader(object):
         normalize (bool): If ``True``, do min-max normalization on data. Default: ``True``
         workday_parser: Used to build external features to be used in neural methods. Default: ``is_work_day_america``
         with_lm (bool): If ``True``, data loader will build graphs according to ``graph``. Default: ``True``
-        with_tpe (bool): If ``True``, data loader will build time position embeddings. Default: ``False``
+        with_tpe (bool): Not supported. Time position embeddings are not built, and ``tpe_dim`` is always ``None``.
         data_dir (:obj:`str` or ``None``): The dataset directory. If set to ``None``, a directory will be created. If
             ``dataset`` is file path, ``data_dir`` should be ``None`` too. Default: ``None``
+        use_cache (bool): If ``True``, the processed data is saved under ``.cache`` of the dataset directory, keyed by
+            the loader arguments and the modification time of the dataset file, and loaded from there by later loaders
+            with the same arguments. Only the base data (traffic data, external features and graphs) is cached, as
+            read-only memory maps, and the train and test samples are rebuilt from it. Default: ``False``
 
     Attributes:
         dataset (DataSet): The DataSet object storing basic data.
         daily_slots (int): The number of time slots in one single day.
         station_number (int): The number of nodes.
         external_dim (int): The number of dimensions of external features.
-        train_closeness (np.ndarray): The closeness history of train set data. When ``with_tpe`` is ``False``,
-            its shape is [train_time_slot_num, ``station_number``, ``closeness_len``, 1].
+        train_closeness (np.ndarray): The closeness history of train set data. Its shape is
+            [train_time_slot_num, ``station_number``, ``closeness_len``, 1].
             On the dimension of ``closeness_len``, data are arranged from earlier time slots to later time slots.
             If ``closeness_len`` is set to 0, train_closeness will be an empty ndarray.
             ``train_period``, ``train_trend``, ``test_closeness``, ``test_period``, ``test_trend`` have similar shape
             and construction.
         train_y (np.ndarray): The train set data. Its shape is [train_time_slot_num, ``station_number``, 1].
             ``test_y`` has similar shape and construction.
+        poi_feature (np.ndarray): If ``'poi'`` is in ``external_use``, the POI features with shape
+            [``station_number``, ``poi_dim``].
+        poi_feature_train (np.ndarray): If ``'poi'`` is in ``external_use``, the POI features of every train set time
+            slot with shape [train_time_slot_num, ``station_number``, ``poi_dim``]. It's a read-only broadcast view of
+            ``poi_feature``, call ``.copy()`` before modifying it.
+            ``poi_feature_test`` has similar shape and construction.
         LM (list): If ``with_lm`` is ``True``, the list of Laplacian matrices of graphs listed in ``graph``.
     """
 
+    # bump when the processed data changes, so caches of former versions are not loaded
+    cache_version = 3
+
+    # attributes rebuilt from the base data by ``build_samples`` and ``build_poi_views``, which are not cached
+    _sample_attributes = ('train_data', 'test_data', 'train_ef', 'test_ef', 'normalizer',
+                          'st_move_sample', 'external_move_sample',
+                          'train_closeness', 'train_period', 'train_trend', 'train_y',
+                          'test_closeness', 'test_period', 'test_trend', 'test_y',
+                          'train_sequence_len', 'test_sequence_len', 'tpe_dim',
+                          'train_ef_closeness', 'train_ef_period', 'train_ef_trend', 'train_lstm_ef',
+                          'test_ef_closeness', 'test_ef_period', 'test_ef_trend', 'test_lstm_ef',
+                          'poi_feature_train', 'poi_feature_test')
+
     def __init__(self,
                  dataset,
                  city=None,
@@ -96,10 +121,19 @@ class NodeTrafficLoader(object):
                  data_dir=None,
                  external_use="weather-holiday-tp",
                  MergeIndex=1,
-                 MergeWay="sum",**kwargs):
+                 MergeWay="sum",
+                 use_cache=False,**kwargs):
+
+        cache_args = {key: value for key, value in locals().items() if key not in ('self', 'use_cache', 'kwargs')}
+        cache_args.update(kwargs)
 
         self.dataset = DataSet(dataset, MergeIndex, MergeWay, city,data_dir=data_dir)
 
+        if use_cache:
+            cache_dir = self.cache_dir(cache_args)
+            if self.load_cache(cache_dir):
+                return
+
         self.daily_slots = 24 * 60 / self.dataset.time_fitness
 
         self.closeness_len = int(closeness_len)
@@ -108,6 +142,7 @@ class NodeTrafficLoader(object):
         self.external_lstm_len = int(external_lstm_len)
         self.poi_distance = int(poi_distance)
         self.poi_dim = None
+        self.poi_feature = None
 
         assert type(self.closeness_len) is int and self.closeness_len >= 0
         assert type(self.period_len) is int and self.period_len >= 0
@@ -127,10 +162,14 @@ class NodeTrafficLoader(object):
         num_time_slots = data_range[1] - data_range[0]
 
         # traffic feature
-        self.traffic_data_index = np.where(np.mean(self.dataset.node_traffic, axis=0) * self.daily_slots > 1)[0]
+        # keep nodes with more than one record per day on average, summed in float32 to avoid a float64 pass
+        daily_traffic = np.sum(self.dataset.node_traffic, axis=0, dtype=np.float32) * \
+                        (self.daily_slots / len(self.dataset.node_traffic))
+        self.traffic_data_index = np.nonzero(daily_traffic > 1)[0]
 
+        # fancy indexing already copies, so a float32 dataset is not copied a second time by astype
         self.traffic_data = self.dataset.node_traffic[data_range[0]:data_range[1], self.traffic_data_index].astype(
-            np.float32)
+            np.float32, copy=False)
         
         if dataset == "Metro":
             print("**** In Metro dataset, we only use the data from 5 to 23 o'clock. *****")
@@ -151,68 +190,57 @@ class NodeTrafficLoader(object):
         # weather feature
         if "weather" in external_use:
             print("**** Using Weather feature ****")
-            temporal_external_feature.append(self.dataset.external_feature_weather[data_range[0]:data_range[1]])
+            temporal_external_feature.append(
+                self.dataset.external_feature_weather[data_range[0]:data_range[1]].astype(np.float32, copy=False))
             temporal_external_onehot_dim.append(self.dataset.external_feature_weather.shape[-1])
             print("weather feature:", self.dataset.external_feature_weather.shape)
 
+        # time stamps of the time slots, Metro data only covers 18 hours a day so 4/3 times slots are generated
+        start_time = pd.Timestamp(self.dataset.time_range[0])
+        feature_slots = int(num_time_slots * (4/3)) if dataset == "Metro" else num_time_slots
+        first_slot_time = start_time + datetime.timedelta(minutes=data_range[0] * self.dataset.time_fitness)
+        slot_time = pd.date_range(first_slot_time, periods=feature_slots, freq='{}min'.format(self.dataset.time_fitness))
+
         # holiday Feature
         if "holiday" in external_use:
             print("**** Using holiday feature ****")
+            # workday_parser only depends on the date, so it is called once per day
+            slot_date, slot_day_index = np.unique(slot_time.normalize(), return_inverse=True)
+            holiday_feature = np.array([1 if workday_parser(e) else 0
+                                        for e in pd.DatetimeIndex(slot_date).to_pydatetime()])[slot_day_index]
+            # one-hot holiday feature
+            holiday_feature = np.eye(holiday_feature.max() + 1, dtype=np.float32)[holiday_feature]
             if dataset == "Metro":
-                holiday_feature = [[1 if workday_parser(parse(self.dataset.time_range[0])
-                                                    + datetime.timedelta(hours=e * self.dataset.time_fitness / 60)) else 0] \
-                            for e in range(data_range[0], int(num_time_slots * (4/3)) + data_range[0])]
-                # one-hot HourOfDay feature
-                holiday_feature = one_hot(holiday_feature)
-                holiday_feature  = holiday_feature[use_index,:]
-
-            else:
-                holiday_feature = [[1 if workday_parser(parse(self.dataset.time_range[0])
-                                                        + datetime.timedelta(hours=e * self.dataset.time_fitness / 60)) else 0] \
-                                for e in range(data_range[0], num_time_slots + data_range[0])]
-                # one-hot holiday feature                  
-                holiday_feature = one_hot(holiday_feature)
+                holiday_feature = holiday_feature[use_index, :]
             temporal_external_feature.append(holiday_feature)
             temporal_external_onehot_dim.append(holiday_feature.shape[-1])
             print("holiday feature:", holiday_feature.shape)
 
         if "tp" in external_use:
             print("**** Using temporal position feature ****")
-            # DayOfWeek Feature
+            hourofday_feature, dayofweek_feature = slot_hour_and_weekday(first_slot_time, self.dataset.time_fitness,
+                                                                         feature_slots)
             if dataset == "Metro":
-                hourofday_feature = [[(parse(self.dataset.time_range[0]) +
-                            datetime.timedelta(hours=e)).hour]
-                            for e in range(data_range[0], int(num_time_slots * (4/3)) + data_range[0])]
-                # one-hot HourOfDay feature
-                hourofday_feature  = one_hot(hourofday_feature)
-                hourofday_feature  = hourofday_feature[use_index,:]
-
-                dayofweek_feature = [[(parse(self.dataset.time_range[0]) +datetime.timedelta(hours=e * self.dataset.time_fitness / 60)).weekday()]
-                                    for e in range(data_range[0], int(num_time_slots * (4/3)) + data_range[0])]
-                dayofweek_feature = one_hot(dayofweek_feature)
-                dayofweek_feature = dayofweek_feature[use_index,:]
+                # HourOfDay in Metro dataset moves one hour per time slot
+                hourofday_feature, _ = slot_hour_and_weekday(start_time + datetime.timedelta(hours=data_range[0]),
+                                                             60, feature_slots)
+
+            # one-hot HourOfDay and DayOfWeek feature
+            hourofday_feature = np.eye(hourofday_feature.max() + 1, dtype=np.float32)[hourofday_feature]
+            dayofweek_feature = np.eye(dayofweek_feature.max() + 1, dtype=np.float32)[dayofweek_feature]
+            if dataset == "Metro":
+                hourofday_feature = hourofday_feature[use_index, :]
+                dayofweek_feature = dayofweek_feature[use_index, :]
 
-            else:
-                hourofday_feature = [[(parse(self.dataset.time_range[0]) +
-                            datetime.timedelta(hours=e * self.dataset.time_fitness / 60)).hour]
-                            for e in range(data_range[0], num_time_slots + data_range[0])]
-                # one-hot HourOfDay feature
-                hourofday_feature = one_hot(hourofday_feature)   
-
-                # DayOfWeek feature  
-                dayofweek_feature = [[(parse(self.dataset.time_range[0]) +datetime.timedelta(hours=e * self.dataset.time_fitness / 60)).weekday()]
-                                        for e in range(data_range[0], num_time_slots + data_range[0])]
-                # one-hot DayOfWeek feature   
-                dayofweek_feature = one_hot(dayofweek_feature)
-            
             temporal_external_onehot_dim.append(hourofday_feature.shape[-1]+dayofweek_feature.shape[-1])
             temporal_external_feature.append(hourofday_feature)
             temporal_external_feature.append(dayofweek_feature)
             print("hour of day feature:", hourofday_feature.shape)
-            print("day of week feature:", dayofweek_feature.shape)            
+            print("day of week feature:", dayofweek_feature.shape)
 
         if len(temporal_external_feature) > 0:
-            self.temporal_external_feature = np.concatenate(temporal_external_feature, axis=-1).astype(np.float32)
+            # all temporal features are float32 already, so concatenate does not upcast
+            self.temporal_external_feature = np.concatenate(temporal_external_feature, axis=-1)
             self.temporal_external_dim = self.temporal_external_feature.shape[-1]
         else:
             self.temporal_external_feature = np.array([])
@@ -230,79 +258,9 @@ class NodeTrafficLoader(object):
             raise ValueError('test_ratio ')
         self.train_test_ratio = [1 - test_ratio, test_ratio]
 
-        self.train_data, self.test_data = SplitData.split_data(self.traffic_data, self.train_test_ratio)
-        self.train_ef, self.test_ef = SplitData.split_data(self.temporal_external_feature, self.train_test_ratio)
-
-        # Normalize the traffic data
-        if normalize:
-            self.normalizer = Normalizer(self.train_data)
-            self.train_data = self.normalizer.min_max_normal(self.train_data)
-            self.test_data = self.normalizer.min_max_normal(self.test_data)
-
-        if train_data_length.lower() != 'all':
-            train_day_length = int(train_data_length)
-            self.train_data = self.train_data[-int(train_day_length * self.daily_slots):]
-            self.train_ef = self.train_ef[-int(train_day_length * self.daily_slots):]
-
-        # expand the test data
-        expand_start_index = len(self.train_data) - \
-                             max(int(self.daily_slots * self.period_len),
-                                 int(self.daily_slots * 7 * self.trend_len),
-                                 self.closeness_len)
-
-        self.test_data = np.vstack([self.train_data[expand_start_index:], self.test_data])
-        self.test_ef = np.vstack([self.train_ef[expand_start_index:], self.test_ef])
-
-        # init move sample obj
-        self.st_move_sample = ST_MoveSample(closeness_len=self.closeness_len,
-                                            period_len=self.period_len,
-                                            trend_len=self.trend_len, target_length=1, daily_slots=self.daily_slots)
-        self.train_closeness, \
-        self.train_period, \
-        self.train_trend, \
-        self.train_y = self.st_move_sample.move_sample(self.train_data)
-
-        self.test_closeness, \
-        self.test_period, \
-        self.test_trend, \
-        self.test_y = self.st_move_sample.move_sample(self.test_data)
-
-        self.train_sequence_len = max((len(self.train_closeness), len(self.train_period), len(self.train_trend)))
-        self.test_sequence_len = max((len(self.test_closeness), len(self.test_period), len(self.test_trend)))
-
-
-        # process historical external features, output shape is [time_slots, historical_windows_size, num_features]
-        self.train_ef_closeness = None
-        self.train_ef_period = None
-        self.train_ef_trend = None
-        self.train_lstm_ef =  None
-        self.test_ef_closeness = None
-        self.test_ef_period = None
-        self.test_ef_trend = None
-        self.test_lstm_ef = None
-        if len(self.temporal_external_feature) > 0:
-            # for early fusion
-            self.external_move_sample = ST_MoveSample(closeness_len=self.closeness_len, period_len=self.period_len, trend_len=self.trend_len, target_length=0, daily_slots=self.daily_slots)
-
-            self.train_ef_closeness, self.train_ef_period, self.train_ef_trend, _ = self.external_move_sample.move_sample(self.train_ef)
-
-            self.test_ef_closeness, self.test_ef_period, self.test_ef_trend, _ = self.external_move_sample.move_sample(self.test_ef)
-
-            # for LSTM variants in late fusion
-            if self.external_lstm_len is not None and self.external_lstm_len > 0:    
-                self.external_move_sample = ST_MoveSample(closeness_len=self.external_lstm_len,period_len=0,trend_len=0, target_length=0, daily_slots=self.daily_slots)
-
-                self.train_lstm_ef, _, _, _ = self.external_move_sample.move_sample(self.train_ef)
-
-                self.test_lstm_ef, _, _, _ = self.external_move_sample.move_sample(self.test_ef)
-
-            # align sequence length
-            self.train_ef = self.train_ef[-self.train_sequence_len - target_length: -target_length]
-            self.test_ef = self.test_ef[-self.test_sequence_len - target_length: -target_length]
-            
-            self.train_lstm_ef = self.train_lstm_ef[-self.train_sequence_len - target_length: -target_length]
-            self.test_lstm_ef = self.test_lstm_ef[-self.test_sequence_len - target_length: -target_length]
-
+        self.normalize = normalize
+        self.target_length = target_length
+        self.build_samples(train_data_length)
 
         #######################################################################################
         ### Loading spatial contextual features, which should be [num_station, num_features]
@@ -321,6 +279,10 @@ class NodeTrafficLoader(object):
             spatial_external_feature.append(poi_feature)
             spatial_external_onehot_dim.append(poi_feature.shape[-1])   
 
+            self.poi_dim = poi_feature.shape[-1]
+            self.poi_feature = poi_feature
+            self.build_poi_views()
+
             print("POIs shape:",poi_feature.shape)
         
         ##### Spatial Position #####
@@ -364,9 +326,8 @@ class NodeTrafficLoader(object):
             self.spatial_external_dim = 0
         self.spatial_external_onehot_dim = spatial_external_onehot_dim
 
-
-        self.tpe_dim = None
-
+        self.with_lm = with_lm
+        self.graph_names = graph.split('-')
         if with_lm:
             self.AM = []
             self.LM = []
@@ -374,8 +335,13 @@ class NodeTrafficLoader(object):
             self.threshold_correlation = threshold_correlation
             self.threshold_interaction = threshold_interaction
 
-            for graph_name in graph.split('-'):
-                AM, LM = self.build_graph(graph_name)
+            # graphs are independent, build them concurrently (numpy releases the GIL in BLAS calls)
+            # and keep the order of ``graph`` in the results
+            graph_names = self.graph_names
+            with ThreadPoolExecutor(max_workers=len(graph_names)) as executor:
+                graphs = list(executor.map(self.build_graph, graph_names))
+
+            for AM, LM in graphs:
                 if AM is not None:
                     self.AM.append(AM)
                 if LM is not None:
@@ -383,15 +349,224 @@ class NodeTrafficLoader(object):
 
             self.LM = np.array(self.LM, dtype=np.float32)
 
+        if use_cache:
+            self.save_cache(cache_dir)
+
+    def build_samples(self, train_data_length):
+        """Split ``traffic_data`` and ``temporal_external_feature`` into train and test set, keep the latest
+        ``train_data_length`` days of train set, and build the closeness, period, trend, target and external
+        feature samples of both sets."""
+        self.train_data_length = train_data_length
+
+        self.train_data, self.test_data = SplitData.split_data(self.traffic_data, self.train_test_ratio)
+        self.train_ef, self.test_ef = SplitData.split_data(self.temporal_external_feature, self.train_test_ratio)
+
+        # Normalize the traffic data
+        if self.normalize:
+            self.normalizer = Normalizer(self.train_data)
+            self.train_data = self.normalizer.min_max_normal(self.train_data)
+            self.test_data = self.normalizer.min_max_normal(self.test_data)
+
+        if train_data_length.lower() != 'all':
+            train_day_length = int(train_data_length)
+            self.train_data = self.train_data[-int(train_day_length * self.daily_slots):]
+            self.train_ef = self.train_ef[-int(train_day_length * self.daily_slots):]
+
+        # expand the test data
+        expand_start_index = len(self.train_data) - \
+                             max(int(self.daily_slots * self.period_len),
+                                 int(self.daily_slots * 7 * self.trend_len),
+                                 self.closeness_len)
+
+        self.test_data = self.prepend(self.train_data[expand_start_index:], self.test_data)
+        self.test_ef = self.prepend(self.train_ef[expand_start_index:], self.test_ef)
+
+        # init move sample obj
+        self.st_move_sample = ST_MoveSample(closeness_len=self.closeness_len,
+                                            period_len=self.period_len,
+                                            trend_len=self.trend_len, target_length=1, daily_slots=self.daily_slots)
+        self.train_closeness, \
+        self.train_period, \
+        self.train_trend, \
+        self.train_y = self.st_move_sample.move_sample(self.train_data)
+
+        self.test_closeness, \
+        self.test_period, \
+        self.test_trend, \
+        self.test_y = self.st_move_sample.move_sample(self.test_data)
+
+        self.train_sequence_len = max((len(self.train_closeness), len(self.train_period), len(self.train_trend)))
+        self.test_sequence_len = max((len(self.test_closeness), len(self.test_period), len(self.test_trend)))
+
+        self.tpe_dim = None
+
+
+        # process historical external features, output shape is [time_slots, historical_windows_size, num_features]
+        self.train_ef_closeness = None
+        self.train_ef_period = None
+        self.train_ef_trend = None
+        self.train_lstm_ef =  None
+        self.test_ef_closeness = None
+        self.test_ef_period = None
+        self.test_ef_trend = None
+        self.test_lstm_ef = None
+        if len(self.temporal_external_feature) > 0:
+            # for early fusion
+            self.external_move_sample = ST_MoveSample(closeness_len=self.closeness_len, period_len=self.period_len, trend_len=self.trend_len, target_length=0, daily_slots=self.daily_slots)
+
+            self.train_ef_closeness, self.train_ef_period, self.train_ef_trend, _ = self.external_move_sample.move_sample(self.train_ef)
+
+            self.test_ef_closeness, self.test_ef_period, self.test_ef_trend, _ = self.external_move_sample.move_sample(self.test_ef)
+
+            # for LSTM variants in late fusion
+            if self.external_lstm_len is not None and self.external_lstm_len > 0:    
+                self.train_lstm_ef = self.lstm_move_sample(self.train_ef, self.train_ef_closeness,
+                                                           self.train_sequence_len)
+
+                self.test_lstm_ef = self.lstm_move_sample(self.test_ef, self.test_ef_closeness,
+                                                          self.test_sequence_len)
+
+            # align sequence length
+            self.train_ef = self.train_ef[-self.train_sequence_len - self.target_length: -self.target_length]
+            self.test_ef = self.test_ef[-self.test_sequence_len - self.target_length: -self.target_length]
+
+    @classmethod
+    def clone_with_train_length(cls, other, train_data_length):
+        """Build a loader sharing ``traffic_data``, external features, graphs and spatial contextual features with
+        ``other``, only the train and test samples, and the correlation graph which is built from the latest 30 days
+        of train data, are rebuilt with the given ``train_data_length``."""
+        loader = copy.copy(other)
+        loader.build_samples(train_data_length)
+        loader.build_poi_views()
+
+        if other.with_lm and 'correlation' in [graph_name.lower() for graph_name in other.graph_names]:
+            loader.AM, loader.LM = list(other.AM), np.array(other.LM)
+            # position of every graph in AM and LM, graphs without adjacent matrix only have a Laplacian matrix
+            am_index, lm_index = 0, 0
+            for graph_name in other.graph_names:
+                graph_name = graph_name.lower()
+                if graph_name == 'correlation':
+                    loader.AM[am_index], loader.LM[lm_index] = loader.build_graph(graph_name)
+                am_index += graph_name in ('distance', 'interaction', 'correlation')
+                lm_index += graph_name in ('distance', 'interaction', 'correlation', 'neighbor', 'line', 'transfer')
+        return loader
+
+    def build_poi_views(self):
+        """POIs are constant over time, so the POI features of every train and test time slot are read-only broadcast
+        views of ``poi_feature``."""
+        if self.poi_dim is None:
+            return
+        self.poi_feature_train = np.broadcast_to(self.poi_feature[np.newaxis],
+                                                 (self.train_sequence_len,) + self.poi_feature.shape)
+        self.poi_feature_test = np.broadcast_to(self.poi_feature[np.newaxis],
+                                                (self.test_sequence_len,) + self.poi_feature.shape)
+
+    def cache_dir(self, cache_args):
+        """The cache directory of a loader built from ``cache_args`` on the current dataset file."""
+        cache_args = {key: '{}.{}'.format(value.__module__, value.__name__) if callable(value) else value
+                      for key, value in cache_args.items()}
+        key = hashlib.sha1((repr(sorted(cache_args.items())) + str(self.cache_version) +
+                            str(os.stat(self.dataset.file_name).st_mtime_ns)).encode()).hexdigest()
+        return os.path.join(self.dataset.data_dir, '.cache', key)
+
+    def save_cache(self, cache_dir):
+        """Save the base data, ndarrays as .npy files and the other attributes in one pickle file. The files are
+        written into a temporary directory which is then renamed to ``cache_dir``, so an interrupted save never
+        leaves a partial cache behind."""
+        parent_dir = os.path.dirname(cache_dir)
+        if os.path.isdir(parent_dir) is False:
+            os.makedirs(parent_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent_dir, prefix='.tmp-')
+        try:
+            attributes = {}
+            for key, value in self.__dict__.items():
+                if key == 'dataset' or key in self._sample_attributes:
+                    continue
+                if isinstance(value, np.ndarray) and value.dtype != object:
+                    np.save(os.path.join(tmp_dir, key + '.npy'), value)
+                else:
+                    attributes[key] = value
+            with open(os.path.join(tmp_dir, 'attributes.pkl'), 'wb') as fp:
+                pickle.dump(attributes, fp)
+            try:
+                os.replace(tmp_dir, cache_dir)
+            except OSError:
+                # another loader saved the same cache first
+                pass
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def load_cache(self, cache_dir):
+        """Load the base data saved by ``save_cache`` and rebuild the samples from it, return ``False`` if there is
+        no cache."""
+        if os.path.isfile(os.path.join(cache_dir, 'attributes.pkl')) is False:
+            return False
+        print("**** Loading cached data from", cache_dir, "****")
+        with open(os.path.join(cache_dir, 'attributes.pkl'), 'rb') as fp:
+            self.__dict__.update(pickle.load(fp))
+        for file_name in os.listdir(cache_dir):
+            if file_name.endswith('.npy'):
+                setattr(self, file_name[:-len('.npy')], np.load(os.path.join(cache_dir, file_name), mmap_mode='r'))
+        self.build_samples(self.train_data_length)
+        self.build_poi_views()
+        return True
+
+    def lstm_move_sample(self, ef, ef_closeness, sequence_len):
+        """Build the ``external_lstm_len`` external feature windows for LSTM variants, aligned with the samples.
+
+        The window of a sample ends ``target_length`` slots before the end of its closeness window in
+        ``ef_closeness``, so when ``external_lstm_len + target_length`` is not longer than ``closeness_len`` the
+        windows are sliced from ``ef_closeness`` instead of move sampling ``ef`` again.
+        """
+        end = self.closeness_len - self.target_length
+        if self.external_lstm_len <= end and len(ef_closeness) >= sequence_len:
+            return ef_closeness[len(ef_closeness) - sequence_len:, :, end - self.external_lstm_len:end]
+        lstm_move_sample = ST_MoveSample(closeness_len=self.external_lstm_len, period_len=0, trend_len=0,
+                                         target_length=0, daily_slots=self.daily_slots)
+        lstm_ef, _, _, _ = lstm_move_sample.move_sample(ef)
+        return lstm_ef[len(lstm_ef) - sequence_len - self.target_length: len(lstm_ef) - self.target_length]
+
+    @staticmethod
+    def prepend(head, data):
+        """Concatenate ``head`` and ``data`` on the first dimension into a single preallocated array."""
+        output = np.empty((len(head) + len(data),) + data.shape[1:], dtype=data.dtype)
+        output[:len(head)] = head
+        output[len(head):] = data
+        return output
+
     def load_spatial_context_from_dir(self, data_dir, data_type="pkl"):
-        
+        """Load the spatial context of the selected nodes.
+
+        ``.npy`` files are memory-mapped so only the rows in ``traffic_data_index`` are read. A ``.pkl`` file is
+        converted to a ``.npy`` file next to it (again unless the ``.npy`` file is newer than the pickle file), which
+        later loaders memory-map instead of unpickling.
+        """
         if data_type == "pkl":
-            with open(data_dir,"rb") as fp:
-                spatial_feature = pickle.load(fp)
-        elif data_type == "npy":
-            spatial_feature = np.load(data_dir)
-       
-        spatial_feature = spatial_feature[self.traffic_data_index]
+            npy_dir = os.path.splitext(data_dir)[0] + '.npy'
+            # the .npy file is only used when it was written after the pickle file
+            if os.path.isfile(npy_dir) is False or os.path.getmtime(npy_dir) <= os.path.getmtime(data_dir):
+                with open(data_dir,"rb") as fp:
+                    spatial_feature = np.asarray(pickle.load(fp))
+                try:
+                    # written to a temporary file and renamed, so an interrupted or concurrent conversion never
+                    # leaves a truncated .npy file in place
+                    fd, tmp_dir = tempfile.mkstemp(suffix='.npy', dir=os.path.dirname(npy_dir) or '.')
+                except OSError:
+                    # read-only data directory, keep using the pickle file
+                    return spatial_feature[self.traffic_data_index]
+                try:
+                    with os.fdopen(fd, 'wb') as fp:
+                        np.save(fp, spatial_feature)
+                    os.replace(tmp_dir, npy_dir)
+                except OSError:
+                    return spatial_feature[self.traffic_data_index]
+                finally:
+                    if os.path.isfile(tmp_dir):
+                        os.remove(tmp_dir)
+            data_dir = npy_dir
+
+        spatial_feature = np.load(data_dir, mmap_mode='r')
+        spatial_feature = np.asarray(spatial_feature[self.traffic_data_index])
         return spatial_feature
 
     def build_graph(self, graph_name):
@@ -522,17 +697,20 @@ class NodeTrafficLoader(object):
             period = self.test_period
             trend = self.test_trend
         if node == 'all':
-            node = list(range(self.station_number))
+            node = slice(None)
+            node_num = self.station_number
+        else:
+            # a basic slice keeps the node axis in place, a list would be an advanced index moved to the front
+            # together with the -1 below
+            node = slice(node, node + 1 or None)
+            node_num = 1
+        history = [feature[:, node, :, -1] for feature, feature_len in
+                   ((closeness, self.closeness_len), (period, self.period_len), (trend, self.trend_len))
+                   if feature_len > 0]
+        if len(history) > 0:
+            history = np.concatenate(history, axis=-1)
         else:
-            node = [node]
-        history = np.zeros([length, len(node), self.closeness_len + self.period_len + self.trend_len])
-        for i in range(len(node)):
-            for c in range(self.closeness_len):
-                history[:, i, c] = closeness[:, node[i], c, -1]
-            for p in range(self.period_len):
-                history[:, i, self.closeness_len + p] = period[:, node[i], p, -1]
-            for t in range(self.trend_len):
-                history[:, i, self.closeness_len + self.period_len + t] = trend[:, node[i], t, -1]
+            history = np.zeros([length, node_num, 0])
         history = np.expand_dims(history, 3)
         return history
 
@@ -547,108 +725,201 @@ class TransferDataLoader(object):
         self.sd_loader = NodeTrafficLoader(**sd_params, **model_params)
         self.td_loader = NodeTrafficLoader(**td_params, **model_params)
 
-        td_params.update({'train_data_length': '180'})
-        self.fake_td_loader = NodeTrafficLoader(**td_params, **model_params)
-
-    def traffic_sim(self):
-
-        assert self.sd_loader.daily_slots == self.td_loader.daily_slots
-
-        similar_record = []
+        self.fake_td_loader = NodeTrafficLoader.clone_with_train_length(self.td_loader, '180')
+
+        self._checkin_feature = {}
+
+    def checkin_feature(self, loader, feature_index):
+        """The ``feature_index``-th element of ``CheckInFeature`` (0 for check-ins and 1 for POIs) of the nodes kept
+        by ``loader``, stacked into a float32 array once and reused by the similarity methods."""
+        key = (id(loader), feature_index)
+        if key not in self._checkin_feature:
+            checkin_feature = loader.dataset.data['ExternalFeature']['CheckInFeature']
+            self._checkin_feature[key] = np.array([e[feature_index] for e in checkin_feature],
+                                                  dtype=np.float32)[loader.traffic_data_index]
+        return self._checkin_feature[key]
+
+    @staticmethod
+    def _similar_record(max_sim, max_index, start=None, end=None):
+        """Pack the most similar source node of every target node into a structured array with fields ``sim``,
+        ``index``, ``start`` and ``end``, or only ``sim`` and ``index`` if no source window is given. Every element
+        can be read positionally as ``[sim, index, start, end]``, and ``.tolist()`` gives the elements as tuples."""
+        fields = [('sim', np.float32), ('index', np.int64)]
+        if start is not None:
+            fields += [('start', np.int64), ('end', np.int64)]
+        record = np.empty(len(max_sim), dtype=fields)
+        record['sim'] = max_sim
+        record['index'] = max_index
+        if start is not None:
+            record['start'] = start
+            record['end'] = end
+        return record
+
+    @staticmethod
+    def _sliding_traffic_sim(td_data, sd_data, stride, chunk_elements=2 ** 25, gpu_threshold=2 ** 26):
+        """Find the most similar source node and window for every target node.
+
+        Windows of ``sd_data`` as long as ``td_data`` start every ``stride`` slots, and the cosine similarity
+        between the target and source series is computed for each window. The target series are normalized once,
+        the source window norms come from a running sum of squares, and the windows are strided views of
+        ``sd_data`` multiplied in batches. A batch holds at most ``chunk_elements`` similarities and at most
+        ``chunk_elements`` elements of source windows, which the matmul may copy into a contiguous operand. When a
+        GPU is available and ``sd_data`` takes more than ``gpu_threshold`` bytes, the batches are multiplied on the
+        GPU with torch, smaller inputs stay on the CPU where the copy to the GPU would cost more than the matmuls.
+        On the GPU, ``torch.max`` may pick a different source node than the CPU ``np.argmax`` when similarities tie.
+        """
+        window = td_data.shape[0]
+        starts = np.arange(0, sd_data.shape[0] - window, stride)
+        if len(starts) == 0:
+            return TransferDataLoader._similar_record([], [], [], [])
+
+        # float32 operands keep every window matmul in single precision BLAS (sgemm)
+        td_data = td_data.astype(np.float32, copy=False)
+        sd_data = np.ascontiguousarray(sd_data, dtype=np.float32)
+
+        td_norm = np.linalg.norm(td_data, axis=0)
+        td_norm[td_norm == 0] = 1
+        td_data = np.ascontiguousarray((td_data / td_norm).transpose())
+
+        sd_square_sum = np.cumsum(np.square(sd_data, dtype=np.float64), axis=0)
+        sd_square_sum = np.concatenate([np.zeros([1, sd_data.shape[1]]), sd_square_sum], axis=0)
+        sd_norm = np.sqrt(np.maximum(sd_square_sum[starts + window] - sd_square_sum[starts], 0)).astype(np.float32)
+        sd_norm[sd_norm == 0] = 1
+
+        row_stride, column_stride = sd_data.strides
+        chunk = max(1, chunk_elements // (max(td_data.shape[0], window) * sd_data.shape[1]))
+
+        use_gpu = sd_data.nbytes > gpu_threshold and torch.cuda.is_available()
+        if use_gpu:
+            device = torch.device('cuda')
+            td_tensor = torch.tensor(td_data, device=device)
+            sd_norm_tensor = torch.tensor(sd_norm, device=device)
+            # [window_num, window, sd_node_num] views of the source series on the GPU
+            window_tensor = torch.tensor(sd_data, device=device).unfold(0, window, stride).transpose(1, 2)[:len(starts)]
+
+        best_sim, best_index, best_start = None, None, None
+        for c in range(0, len(starts), chunk):
+            chunk_starts = starts[c:c + chunk]
+
+            if use_gpu:
+                # one 2-D matmul of [td_node_num, window] by [window, window_num * sd_node_num], so the target
+                # series are not expanded to the batch, reshaped to [window_num, td_node_num, sd_node_num]
+                windows = window_tensor[c:c + chunk]
+                windows = windows.permute(1, 0, 2).reshape(window, -1)
+                sim = torch.matmul(td_tensor, windows).reshape(td_tensor.shape[0], len(chunk_starts), -1)
+                sim = sim.permute(1, 0, 2) / sd_norm_tensor[c:c + chunk, None, :]
+                max_sim, max_index = torch.max(sim, dim=2)
+                max_sim, max_index = max_sim.cpu().numpy(), max_index.cpu().numpy()
+            else:
+                windows = as_strided(sd_data[chunk_starts[0]:], shape=(len(chunk_starts), window, sd_data.shape[1]),
+                                     strides=(stride * row_stride, row_stride, column_stride), writeable=False)
 
-        for i in range(0, self.sd_loader.train_data.shape[0] - self.td_loader.train_data.shape[0],
-                       int(self.sd_loader.daily_slots)):
+                # [window_num, td_node_num, sd_node_num]
+                sim = np.matmul(td_data, windows) / sd_norm[c:c + chunk, np.newaxis, :]
 
-            sim = cosine_similarity(self.td_loader.train_data.transpose(),
-                                    self.sd_loader.train_data[i:i + self.td_loader.train_data.shape[0]].transpose())
+                max_index = np.argmax(sim, axis=2)
+                max_sim = np.take_along_axis(sim, max_index[:, :, np.newaxis], axis=2)[:, :, 0]
 
-            max_sim, max_index = np.max(sim, axis=1), np.argmax(sim, axis=1)
+            # the first window holding the best similarity of every td node
+            window_index = np.argmax(max_sim, axis=0)
+            node_index = np.arange(max_sim.shape[1])
+            chunk_sim = max_sim[window_index, node_index]
+            chunk_index = max_index[window_index, node_index]
+            chunk_start = chunk_starts[window_index]
 
-            if len(similar_record) == 0:
-                similar_record = [[max_sim[e], max_index[e], i, i + self.td_loader.train_data.shape[0]]
-                                  for e in range(len(max_sim))]
+            if best_sim is None:
+                best_sim, best_index, best_start = chunk_sim, chunk_index, chunk_start
             else:
-                for index in range(len(similar_record)):
-                    if similar_record[index][0] < max_sim[index]:
-                        similar_record[index] = [max_sim[index], max_index[index], i,
-                                                 i + self.td_loader.train_data.shape[0]]
+                update = best_sim < chunk_sim
+                best_sim = np.where(update, chunk_sim, best_sim)
+                best_index = np.where(update, chunk_index, best_index)
+                best_start = np.where(update, chunk_start, best_start)
+
+        return TransferDataLoader._similar_record(best_sim, best_index, best_start, best_start + window)
+
+    @staticmethod
+    def _normalize_rows(data):
+        """L2 normalize the rows of a float ndarray in place, rows of zeros are kept as zeros."""
+        norm = np.linalg.norm(data, axis=1, keepdims=True)
+        norm[norm == 0] = 1
+        data /= norm
+        return data
+
+    @staticmethod
+    def _row_max_similarity(td_data, sd_data, block_size=1024):
+        """The largest dot product of every row of ``td_data`` with the rows of ``sd_data`` and its index.
+
+        The products are computed for ``block_size`` rows of ``td_data`` at a time, so only a
+        [``block_size``, ``len(sd_data)``] block is held instead of the full similarity matrix.
+        """
+        max_sim = np.empty(len(td_data), dtype=np.result_type(td_data, sd_data))
+        max_index = np.empty(len(td_data), dtype=np.int64)
 
-        return similar_record
+        sd_data = sd_data.transpose()
+        for b in range(0, len(td_data), block_size):
+            block = np.dot(td_data[b:b + block_size], sd_data)
+            max_index[b:b + block_size] = np.argmax(block, axis=1)
+            max_sim[b:b + block_size] = block[np.arange(len(block)), max_index[b:b + block_size]]
 
-    def traffic_sim_fake(self):
+        return max_sim, max_index
 
-        assert self.sd_loader.daily_slots == self.fake_td_loader.daily_slots
-
-        similar_record = []
+    def traffic_sim(self):
 
-        for i in range(0, self.sd_loader.train_data.shape[0] - self.fake_td_loader.train_data.shape[0],
-                       int(self.sd_loader.daily_slots)):
+        assert self.sd_loader.daily_slots == self.td_loader.daily_slots
 
-            sim = cosine_similarity(self.fake_td_loader.train_data.transpose(),
-                                    self.sd_loader.train_data[
-                                    i:i + self.fake_td_loader.train_data.shape[0]].transpose())
+        return self._sliding_traffic_sim(self.td_loader.train_data, self.sd_loader.train_data,
+                                         int(self.sd_loader.daily_slots))
 
-            max_sim, max_index = np.max(sim, axis=1), np.argmax(sim, axis=1)
+    def traffic_sim_fake(self):
 
-            if len(similar_record) == 0:
-                similar_record = [[max_sim[e], max_index[e], i, i + self.fake_td_loader.train_data.shape[0]]
-                                  for e in range(len(max_sim))]
-            else:
-                for index in range(len(similar_record)):
-                    if similar_record[index][0] < max_sim[index]:
-                        similar_record[index] = [max_sim[index], max_index[index], i,
-                                                 i + self.td_loader.train_data.shape[0]]
+        assert self.sd_loader.daily_slots == self.fake_td_loader.daily_slots
 
-        return similar_record
+        return self._sliding_traffic_sim(self.fake_td_loader.train_data, self.sd_loader.train_data,
+                                         int(self.sd_loader.daily_slots))
 
     def checkin_sim(self):
 
-        from sklearn.metrics.pairwise import cosine_similarity
-
-        td_checkin = np.array([e[0] for e in self.td_loader.dataset.data['ExternalFeature']['CheckInFeature']]
-                              )[self.td_loader.traffic_data_index]
-        sd_checkin = np.array([e[0] for e in self.sd_loader.dataset.data['ExternalFeature']['CheckInFeature']]
-                              )[self.sd_loader.traffic_data_index]
+        td_checkin = self.checkin_feature(self.td_loader, 0)
+        sd_checkin = self.checkin_feature(self.sd_loader, 0)
 
         td_checkin = td_checkin / (np.max(td_checkin, axis=1, keepdims=True) + 0.0001)
         sd_checkin = sd_checkin / (np.max(sd_checkin, axis=1, keepdims=True) + 0.0001)
 
-        # cs = cosine_similarity(td_checkin, sd_checkin)
+        # pearson correlation of td and sd node pairs, computed as matmuls of the centered and normalized
+        # check-in rows, in place on the float32 copies made above
+        td_checkin -= np.mean(td_checkin, axis=1, keepdims=True)
+        sd_checkin -= np.mean(sd_checkin, axis=1, keepdims=True)
 
-        # similar_record = [[e[np.argmax(e)], np.argmax(e), ] for e in cs]
+        max_sim, max_index = self._row_max_similarity(self._normalize_rows(td_checkin),
+                                                      self._normalize_rows(sd_checkin))
 
-        similar_record = []
-        for td_index in range(len(td_checkin)):
-            tmp_sim_record = []
-            for sd_index in range(len(sd_checkin)):
-                r, p = pearsonr(td_checkin[td_index], sd_checkin[sd_index])
-                tmp_sim_record.append([r, sd_index,
-                                       len(self.sd_loader.train_y) - len(self.td_loader.train_y),
-                                       len(self.sd_loader.train_y)])
-            similar_record.append(max(tmp_sim_record, key=lambda x: x[0]))
+        start = len(self.sd_loader.train_y) - len(self.td_loader.train_y)
+        end = len(self.sd_loader.train_y)
 
-        return similar_record
+        return self._similar_record(max_sim, max_index, start, end)
 
     def checkin_sim_sd(self):
 
-        sd_checkin = np.array([e[0] for e in self.sd_loader.dataset.data['ExternalFeature']['CheckInFeature']]
-                              )[self.sd_loader.traffic_data_index]
+        sd_checkin = self.checkin_feature(self.sd_loader, 0)
         sd_checkin = sd_checkin / (np.max(sd_checkin, axis=1, keepdims=True) + 0.0001)
+        sd_checkin = self._normalize_rows(sd_checkin)
 
-        cs = cosine_similarity(sd_checkin, sd_checkin) - np.eye(sd_checkin.shape[0])
+        # numpy runs the product of a matrix with its own transpose as a symmetric rank-k update (syrk)
+        cs = np.dot(sd_checkin, sd_checkin.transpose())
+        # a node is never its own most similar node
+        np.fill_diagonal(cs, -np.inf)
 
-        return np.array([np.argmax(e) for e in cs], np.int32)
+        return np.argmax(cs, axis=1).astype(np.int32)
 
     def poi_sim(self):
 
-        from sklearn.metrics.pairwise import cosine_similarity
+        td_checkin = self._normalize_rows(self.checkin_feature(self.td_loader, 1).copy())
+        sd_checkin = self._normalize_rows(self.checkin_feature(self.sd_loader, 1).copy())
 
-        td_checkin = np.array([e[1] for e in self.td_loader.dataset.data['ExternalFeature']['CheckInFeature']]
-                              )[self.td_loader.traffic_data_index]
-        sd_checkin = np.array([e[1] for e in self.sd_loader.dataset.data['ExternalFeature']['CheckInFeature']]
-                              )[self.sd_loader.traffic_data_index]
+        # cosine similarity of the L2 normalized rows, without holding the full similarity matrix
+        max_sim, max_index = self._row_max_similarity(td_checkin, sd_checkin)
 
-        return [[e[np.argmax(e)], np.argmax(e), ] for e in cosine_similarity(td_checkin, sd_checkin)]
+        return self._similar_record(max_sim, max_index)
 
 
 def normalize_dataset(data, normalizer, column_wise=False):
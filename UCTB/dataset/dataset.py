@@ -16,6 +16,7 @@ class DataSet(object):
             If ``dataset`` is file path, ``data_dir`` should be ``None`` too. Default: ``None``
 
     Attributes:
+        file_name (str): Path of the dataset pickle file.
         data (dict): The data directly from the pickle file. ``data`` may have a ``data['contribute_data']`` dict to
             store supplementary data.
         time_range (list): From ``data['TimeRange']`` in the format of [YYYY-MM-DD, YYYY-MM-DD] indicating the time
@@ -43,7 +44,7 @@ class DataSet(object):
 
         if data_dir is None:
             data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
-            self.data_dir = data_dir
+        self.data_dir = data_dir
 
         if os.path.isdir(data_dir) is False:
             os.makedirs(data_dir)
@@ -73,6 +74,7 @@ class DataSet(object):
                 print(e)
                 raise FileExistsError('Download Failed')
 
+        self.file_name = pkl_file_name
         with open(pkl_file_name, 'rb') as f:
             self.data = pickle.load(f)
 
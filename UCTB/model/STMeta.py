@@ -1,5 +1,6 @@
 import keras
 import tensorflow as tf
+from tensorflow.core.protobuf import rewriter_config_pb2
 import numpy as np
 
 from ..model_unit import BaseModel
@@ -52,6 +53,9 @@ class STMeta(BaseModel):
             gpu_device(str): To specify the GPU to use. Default: '0'.
             external_method(str): to decide how we model external features. Its values can be `not` `direct` `embedding` `classified` `gating`
             decay_param=(str): The file path of decay function parameter. If set `None`, using fixed lr. default: None.
+            mixed_precision(bool): If set to ``True``, matmuls run in float16 on GPU with dynamic loss scaling, while
+                placeholders, variables and the loss stay in float32. Requires TensorFlow 1.14 or later, which is newer than
+                the TensorFlow 1.13 of env.yaml, otherwise a ValueError is raised. Default: False.
         """
 
     def __init__(self,
@@ -97,7 +101,8 @@ class STMeta(BaseModel):
                  single_embedding_dim = 16, # dim of single embedding layer
                  classified_temporal_feature_dim = [],
                  classified_spatial_feature_dim = [],
-                 decay_param=None,**kwargs):
+                 decay_param=None,
+                 mixed_precision=False,**kwargs):
         # no direct one_layer classified
         super(STMeta, self).__init__(code_version=code_version, model_dir=model_dir, gpu_device=gpu_device)
 
@@ -133,8 +138,10 @@ class STMeta(BaseModel):
         self._num_dense_units = num_dense_units
         self._lr = lr
 
+        self._mixed_precision = mixed_precision
+
         # add decay func
-        self._optimizer = Optimizer(decay_param=decay_param,lr=self._lr)
+        self._optimizer = Optimizer(decay_param=decay_param,lr=self._lr,mixed_precision=mixed_precision)
         
         # external modelling method
         # ordered by 'representation-alignment-fusion' and split by '-'
@@ -162,9 +169,12 @@ class STMeta(BaseModel):
     
     def build(self, init_vars=True, max_to_keep=5):
         with self._graph.as_default():
+
+            # one regularizer object shared by every dense layer
+            l2_regularizer = tf.keras.regularizers.l2(0.01)
             
             def MLP(hidden_state, input_tensor, activation=None):
-                return tf.keras.layers.Dense(units=hidden_state,kernel_regularizer=tf.keras.regularizers.l2(0.01),bias_regularizer=tf.keras.regularizers.l2(0.01), activation=activation)(input_tensor)
+                return tf.keras.layers.Dense(units=hidden_state,kernel_regularizer=l2_regularizer,bias_regularizer=l2_regularizer, activation=activation)(input_tensor)
             
             def multiple_embedding_layer(input_tensor, feature_dim_list, embedding_dim_list, agg_axis=-1):
                 '''
@@ -173,15 +183,46 @@ class STMeta(BaseModel):
                 embedding_dim_list: embedding dim for each type of context (e.g., [8, 1, 8])
                 agg_axis: axis for concatenation (default: -1)
                 '''
-                output = []
-                ind = 0
-                for i,tmp in enumerate(feature_dim_list):
-                    tensor_slice = tf.strided_slice(input_tensor,[0,0,0,ind],[tf.shape(input_tensor)[0],tf.shape(input_tensor)[1],tf.shape(input_tensor)[2],ind+tmp],[1,1,1,1])
-                    tensor_slice = tf.reshape(tensor_slice,[tf.shape(input_tensor)[0],tf.shape(input_tensor)[1],tf.shape(input_tensor)[2], tmp])
-                    extern_embedding = tf.keras.layers.Dense(units=embedding_dim_list[i],kernel_regularizer=tf.keras.regularizers.l2(0.01),bias_regularizer=tf.keras.regularizers.l2(0.01))(tensor_slice)
-                    output.append(extern_embedding)
-                    ind += tmp
-                return tf.concat(output,axis=agg_axis)
+                assert input_tensor.get_shape().ndims == 4, 'input_tensor should be (batch_size, num_node, 1, feature_dim)'
+                # the embeddings of all types of context are computed by one matmul whose kernel is masked to the
+                # block diagonal, i.e. every type of context is only mapped to its own embedding
+                feature_dim, embedding_dim = sum(feature_dim_list), sum(embedding_dim_list)
+                block_slices = []
+                mask = np.zeros([feature_dim, embedding_dim], dtype=np.float32)
+                feature_ind, embedding_ind = 0, 0
+                for tmp, embedding_tmp in zip(feature_dim_list, embedding_dim_list):
+                    block_slices.append([feature_ind, tmp, embedding_ind, embedding_tmp])
+                    mask[feature_ind:feature_ind + tmp, embedding_ind:embedding_ind + embedding_tmp] = 1
+                    feature_ind += tmp
+                    embedding_ind += embedding_tmp
+
+                def block_diagonal_initializer(shape, dtype=tf.float32, partition_info=None):
+                    # glorot uniform initialization of every block on its own fan in and fan out
+                    return tf.add_n([tf.pad(tf.glorot_uniform_initializer()([tmp, embedding_tmp], dtype=dtype),
+                                            [[feature_ind, feature_dim - feature_ind - tmp],
+                                             [embedding_ind, embedding_dim - embedding_ind - embedding_tmp]])
+                                     for feature_ind, tmp, embedding_ind, embedding_tmp in block_slices])
+
+                with tf.variable_scope(None, default_name='multiple_embedding_layer'):
+                    kernel = tf.get_variable('kernel', [feature_dim, embedding_dim], initializer=block_diagonal_initializer,
+                                             regularizer=l2_regularizer)
+                    bias = tf.get_variable('bias', [embedding_dim], initializer=tf.zeros_initializer(),
+                                           regularizer=l2_regularizer)
+                    kernel = tf.multiply(kernel, mask, name='block_diagonal_kernel')
+
+                    output = tf.tensordot(input_tensor, kernel, [[3], [0]]) + bias
+                    if agg_axis in [-2, 2]:
+                        # every type of context has the same embedding dim and is stacked on axis 2
+                        assert len(set(embedding_dim_list)) == 1, 'embedding dims should be equal to stack on axis 2'
+                        output = tf.reshape(output, [-1, tf.shape(input_tensor)[1], len(embedding_dim_list), embedding_dim_list[0]])
+                return output
+
+            def broadcast_like(input_tensor, reference_tensor):
+                '''
+                broadcast all but the last axis of input_tensor to reference_tensor, e.g. before concatenation.
+                Ops like add and multiply broadcast by themselves and don't need it.
+                '''
+                return input_tensor + tf.zeros_like(reference_tensor[..., :1])
 
             def attention(inputs, attention_units):    
                 query = tf.keras.layers.Dense(units=attention_units, activation=tf.nn.tanh)(inputs)
@@ -263,6 +304,12 @@ class STMeta(BaseModel):
 
                     outputs_temporal = []
 
+                    if self._st_method in ['GRU', 'LSTM']:
+                        # distinct cells for every layer, shared by closeness, period and trend features
+                        rnn_cell = tf.keras.layers.GRUCell if self._st_method == 'GRU' else tf.keras.layers.LSTMCell
+                        multi_layer_rnn = tf.keras.layers.StackedRNNCells(
+                            [rnn_cell(units=self._num_hidden_unit) for _ in range(self._gclstm_layers)])
+
                     for t_ind, temporal_item in enumerate(temporal_features):
                         
                         time_step, target_tensor, given_name = temporal_item
@@ -275,14 +322,14 @@ class STMeta(BaseModel):
                                 early_concat_temporal_embedding_dim = 16
                                 after_earlyconcat_dims += early_concat_temporal_embedding_dim
                                 temporal_context_embedding = MLP(early_concat_temporal_embedding_dim, tf.reshape(external_temporal_features_for_earlyfusion[t_ind], [-1, 1, time_step, self._temporal_external_dim]))
-                                temporal_external_tile = tf.tile(temporal_context_embedding, [1, self._num_node, 1, 1])
+                                temporal_external_tile = broadcast_like(temporal_context_embedding, target_tensor)
                                 target_tensor = tf.concat([target_tensor, temporal_external_tile], axis = -1)
                             
                             if self.spatialFeatureFlag:
                                 early_concat_spatial_embedding_dim = 16
                                 after_earlyconcat_dims += early_concat_spatial_embedding_dim
                                 spatial_context_embedding = MLP(early_concat_spatial_embedding_dim, tf.reshape(spatial_external_input, [1, self._num_node, 1, self._spatial_external_dim]))
-                                spatial_external_tile = tf.tile(spatial_context_embedding, [tf.shape(target)[0], 1, time_step, 1])
+                                spatial_external_tile = broadcast_like(spatial_context_embedding, target_tensor)
                                 target_tensor = tf.concat([target_tensor,spatial_external_tile], axis = -1)
 
                         if self.earlyaddFlag:
@@ -293,7 +340,7 @@ class STMeta(BaseModel):
                             
                             if self.spatialFeatureFlag:
                                 spatial_context_embedding = MLP(1, spatial_external_input, activation=tf.nn.tanh)
-                                spatial_context_embedding = tf.tile(tf.reshape(spatial_context_embedding, [1, self._num_node, 1, 1]), [1, 1, time_step, 1])
+                                spatial_context_embedding = tf.reshape(spatial_context_embedding, [1, self._num_node, 1, 1])
                                 target_tensor = tf.add(target_tensor, spatial_context_embedding)
 
                         if self._st_method == 'GCLSTM':
@@ -313,41 +360,31 @@ class STMeta(BaseModel):
 
                         elif self._st_method == 'DCRNN':
 
-                            cell = DCGRUCell(self._num_hidden_unit, 1, self._num_graph,
-                                             # laplace_matrix will be diffusion_matrix when self._st_method == 'DCRNN'
-                                             laplace_matrix,
-                                             max_diffusion_step=self._gcn_k,
-                                             num_nodes=self._num_node, name=str(graph_index) + given_name)
-
-                            encoding_cells = [cell] * self._gclstm_layers
+                            encoding_cells = [DCGRUCell(self._num_hidden_unit, 1, self._num_graph,
+                                                        # laplace_matrix will be diffusion_matrix when self._st_method == 'DCRNN'
+                                                        laplace_matrix,
+                                                        max_diffusion_step=self._gcn_k,
+                                                        num_nodes=self._num_node, name=str(graph_index) + given_name)
+                                              for _ in range(self._gclstm_layers)]
                             encoding_cells = tf.contrib.rnn.MultiRNNCell(encoding_cells, state_is_tuple=True)
 
+                            # with shape (batch_size, time_step, num_node * feature_dim), and the time steps run in
+                            # a while loop instead of being unrolled into the graph
                             if self.earlyconcatFlag:
-                                target_tensor = tf.transpose(target_tensor,[0,1,3,2])
+                                target_tensor = tf.transpose(target_tensor,[0,2,1,3])
 
-                                inputs_unstack = tf.unstack(tf.reshape(target_tensor, [-1, self._num_node*after_earlyconcat_dims, time_step]),axis=-1)
+                                inputs = tf.reshape(target_tensor, [-1, time_step, self._num_node*after_earlyconcat_dims])
                                 
                             else:
-                                inputs_unstack = tf.unstack(tf.reshape(target_tensor, [-1, self._num_node, time_step]),axis=-1)
+                                inputs = tf.transpose(tf.reshape(target_tensor, [-1, self._num_node, time_step]), [0, 2, 1])
                             
-                            outputs, _ = \
-                                tf.contrib.rnn.static_rnn(encoding_cells, inputs_unstack, dtype=tf.float32)
+                            outputs, _ = tf.nn.dynamic_rnn(encoding_cells, inputs, dtype=tf.float32)
 
-                            st_outputs = tf.reshape(outputs[-1], [-1, 1, self._num_hidden_unit])
+                            st_outputs = tf.reshape(outputs[:, -1], [-1, 1, self._num_hidden_unit])
 
-                        elif self._st_method == 'GRU':
+                        elif self._st_method in ['GRU', 'LSTM']:
 
-                            cell = tf.keras.layers.GRUCell(units=self._num_hidden_unit)
-                            multi_layer_gru = tf.keras.layers.StackedRNNCells([cell] * self._gclstm_layers)
-                            outputs = tf.keras.layers.RNN(multi_layer_gru)(
-                                tf.reshape(target_tensor, [-1, time_step, 1]))
-                            st_outputs = tf.reshape(outputs, [-1, 1, self._num_hidden_unit])
-
-                        elif self._st_method == 'LSTM':
-
-                            cell = tf.keras.layers.LSTMCell(units=self._num_hidden_unit)
-                            multi_layer_gru = tf.keras.layers.StackedRNNCells([cell] * self._gclstm_layers)
-                            outputs = tf.keras.layers.RNN(multi_layer_gru)(
+                            outputs = tf.keras.layers.RNN(multi_layer_rnn)(
                                 tf.reshape(target_tensor, [-1, time_step, 1]))
                             st_outputs = tf.reshape(outputs, [-1, 1, self._num_hidden_unit])
 
@@ -382,7 +419,9 @@ class STMeta(BaseModel):
 
                 dense_inputs = graph_outputs_list[-1]
 
-            dense_inputs = tf.reshape(dense_inputs, [-1, self._num_node, 1, dense_inputs.get_shape()[-1].value])
+            # feature dim of the merged spatial-temporal features, before the external features are fused
+            dense_dim = dense_inputs.get_shape()[-1].value
+            dense_inputs = tf.reshape(dense_inputs, [-1, self._num_node, 1, dense_dim])
 
             dense_inputs = tf.keras.layers.BatchNormalization(axis=-1, name='feature_map')(dense_inputs)
             
@@ -398,27 +437,25 @@ class STMeta(BaseModel):
                     ############################################################
                     ### temporal duplication for spatial contex
                     ############################################################
+                    # the contexts are kept with shape (batch_size, 1, 1, dim) and (1, num_node, 1, dim), and
+                    # only duplicated when they have to be concatenated
                     external_dense = []
                     if self.temporalFeatureFlag:
                         ### spatial duplication for temporal context
-                        duplicated_temporal_features = tf.tile(tf.reshape(temporal_external_input, [-1, 1, 1, self._temporal_external_dim]), [1, self._num_node, 1, 1])
-                        external_dense.append(duplicated_temporal_features)
+                        external_dense.append(tf.reshape(temporal_external_input, [-1, 1, 1, self._temporal_external_dim]))
                     if self.spatialFeatureFlag:
                         ### temporal duplication for spatial context
-                        duplicated_spatial_features = tf.tile(tf.reshape(spatial_external_input, [1, self._num_node, 1, self._spatial_external_dim]), [tf.shape(dense_inputs)[0], 1, 1, 1])
-                        external_dense.append(duplicated_spatial_features)
+                        external_dense.append(tf.reshape(spatial_external_input, [1, self._num_node, 1, self._spatial_external_dim]))
 
                     if len(external_dense) > 1:
-                        external_dense = tf.concat(external_dense, axis=-1)
+                        # external_dense with shape (batch_size, num_node, 1, external_dim)
+                        external_dense = tf.concat([broadcast_like(e, dense_inputs) for e in external_dense], axis=-1)
                     elif len(external_dense) == 1:
                         external_dense = external_dense[0]
                     else:
                         raise ValueError("No external features are used.")
 
                     self._external_dim = self._temporal_external_dim + self._spatial_external_dim
-                   
-                   # external_dense with shape (batch_size, num_node, 1, external_dim)
-                    external_dense = tf.reshape(external_dense, [-1, self._num_node, 1, self._external_dim])
 
 
                     ####################
@@ -431,7 +468,7 @@ class STMeta(BaseModel):
                     elif self.external_method[0] == "emb":
                         
                         print("**** Using one embedding layer >> {} ****".format(self._single_embedding_dim))    
-                        external_dense = tf.keras.layers.Dense(units=self._single_embedding_dim, kernel_regularizer=tf.keras.regularizers.l2(0.01), bias_regularizer=tf.keras.regularizers.l2(0.01))(external_dense)
+                        external_dense = tf.keras.layers.Dense(units=self._single_embedding_dim, kernel_regularizer=l2_regularizer, bias_regularizer=l2_regularizer)(external_dense)
                     
 
                     elif self.external_method[0] == "multi":
@@ -451,21 +488,22 @@ class STMeta(BaseModel):
                             cell = tf.keras.layers.LSTMCell(units=lstm_hidden_for_historial_temporal_context)
                             multi_layer_gru = tf.keras.layers.StackedRNNCells([cell] * 1)
                             external_dense = tf.keras.layers.RNN(multi_layer_gru)(tf.reshape(past_temporal_context_for_LSTM, [-1, self._external_lstm_len, self._temporal_external_dim]))
-                            external_dense = tf.tile(tf.reshape(external_dense, [-1, 1, 1, lstm_hidden_for_historial_temporal_context]),[1, self._num_node, 1, 1])
+                            external_dense = tf.reshape(external_dense, [-1, 1, 1, lstm_hidden_for_historial_temporal_context])
                         
                         if self.spatialFeatureFlag:
                             # MLP for spatial external features
                             embedding_dim_for_spatial_context_in_LSTM = 16
                             spatial_context_embedding = MLP(embedding_dim_for_spatial_context_in_LSTM, spatial_external_input)
-                            spatial_context_embedding = tf.tile(tf.reshape(spatial_context_embedding, [1, self._num_node, 1, embedding_dim_for_spatial_context_in_LSTM]), [tf.shape(dense_inputs)[0], 1, 1, 1])
-                            external_dense = tf.concat([external_dense, spatial_context_embedding], axis = -1)
+                            spatial_context_embedding = tf.reshape(spatial_context_embedding, [1, self._num_node, 1, embedding_dim_for_spatial_context_in_LSTM])
+                            external_dense = tf.concat([broadcast_like(external_dense, dense_inputs),
+                                                        broadcast_like(spatial_context_embedding, dense_inputs)], axis = -1)
 
 
                     elif self.external_method[0] == "MGate":
                         classified_ST_feature_dim = self._classified_temporal_feature_dim + self._classified_spatial_feature_dim
                         print("**** Using multiple linear layers {}, which is prepared for multiple gating. ****".format(classified_ST_feature_dim))
                         
-                        external_dense = multiple_embedding_layer(external_dense, classified_ST_feature_dim, [dense_inputs.get_shape()[-1].value]*len(classified_ST_feature_dim), agg_axis=-2) # [T, N, num_external_categories, D]
+                        external_dense = multiple_embedding_layer(external_dense, classified_ST_feature_dim, [dense_dim]*len(classified_ST_feature_dim), agg_axis=-2) # [T, N, num_external_categories, D]
                     else:
                         raise ValueError("The first `external method` parameter is wrong.")
 
@@ -478,7 +516,7 @@ class STMeta(BaseModel):
                         print("**** This model doesn't have alignment stage.****")
 
                     elif self.external_method[1] == "linear":
-                        external_dense = MLP(dense_inputs.get_shape()[-1], external_dense)
+                        external_dense = MLP(dense_dim, external_dense)
                     else:
                         raise ValueError("The second `external method` parameter is wrong.")
                     
@@ -486,7 +524,7 @@ class STMeta(BaseModel):
                     ## fusion stage
                     ##############
                     if self.external_method[2] == "concat":
-                        dense_inputs = tf.concat([dense_inputs, external_dense], axis=-1)
+                        dense_inputs = tf.concat([dense_inputs, broadcast_like(external_dense, dense_inputs)], axis=-1)
 
                     elif self.external_method[2] == "add":
                         dense_inputs = tf.add(dense_inputs, external_dense)
@@ -509,7 +547,7 @@ class STMeta(BaseModel):
                         gating_output = tf.multiply(dense_inputs, external_dense)
 
                         attn_input = tf.concat([dense_inputs, gating_output], axis=-2) # [T, N, 2, D]
-                        attn_input = tf.reshape(attn_input, [-1, 2, attn_input.get_shape()[-1].value]) # [T*N, 2, D]
+                        attn_input = tf.reshape(attn_input, [-1, 2, dense_dim]) # [T*N, 2, D]
                         
                         attn_output = attention(attn_input, self._num_hidden_unit//2) # [T*N, 2, D]
 
@@ -519,15 +557,15 @@ class STMeta(BaseModel):
                         assert self.external_method[0] == "MGate"
                         
                         gating_output = tf.multiply(dense_inputs, external_dense) # [T, N, num_external_categories, D]                
-                        gating_output = tf.reshape(gating_output, [-1, self._num_node, 1, len(classified_ST_feature_dim) * dense_inputs.get_shape()[-1].value]) # [T, N, 1, num_external_categories*D]
+                        gating_output = tf.reshape(gating_output, [-1, self._num_node, 1, len(classified_ST_feature_dim) * dense_dim]) # [T, N, 1, num_external_categories*D]
                         dense_inputs = tf.concat([dense_inputs, gating_output], axis=-1)
 
                     elif self.external_method[2] == "MGateConcatRes":
                         assert self.external_method[0] == "MGate"
                         
                         gating_output = tf.multiply(dense_inputs, external_dense) # [T, N, num_external_categories, D]                
-                        gating_output = tf.reshape(gating_output, [-1, self._num_node, 1, len(classified_ST_feature_dim) * dense_inputs.get_shape()[-1].value]) # [T, N, 1, num_external_categories*D]
-                        gating_output = MLP(dense_inputs.get_shape()[-1].value, gating_output)
+                        gating_output = tf.reshape(gating_output, [-1, self._num_node, 1, len(classified_ST_feature_dim) * dense_dim]) # [T, N, 1, num_external_categories*D]
+                        gating_output = MLP(dense_dim, gating_output)
 
                         dense_inputs = tf.add(dense_inputs, gating_output)
 
@@ -538,7 +576,7 @@ class STMeta(BaseModel):
                         gating_output = tf.multiply(dense_inputs, external_dense) # [T, N, num_external_categories, D]
                         
                         attn_input = tf.concat([dense_inputs, gating_output], axis=-2) # [T, N, num_external_categories + 1, D]
-                        attn_input = tf.reshape(attn_input, [-1, 1 + len(classified_ST_feature_dim), dense_inputs.get_shape()[-1].value]) # [T*N, num_external_categories + 1, D]
+                        attn_input = tf.reshape(attn_input, [-1, 1 + len(classified_ST_feature_dim), dense_dim]) # [T*N, num_external_categories + 1, D]
                         
                         attn_output = attention(attn_input, self._num_hidden_unit//2) # [T*N, num_external_categories + 1, D]
 
@@ -551,10 +589,10 @@ class STMeta(BaseModel):
                         gating_output = tf.multiply(dense_inputs, external_dense) # [T, N, num_external_categories, D]
                         
                         attn_input = tf.concat([dense_inputs, gating_output], axis=-2) # [T, N, 1 + num_external_categories, D]
-                        attn_input = tf.reshape(attn_input, [-1, 1 + len(classified_ST_feature_dim), dense_inputs.get_shape()[-1].value]) # [T*N, 1 + num_external_categories, D]
+                        attn_input = tf.reshape(attn_input, [-1, 1 + len(classified_ST_feature_dim), dense_dim]) # [T*N, 1 + num_external_categories, D]
                         attn_output = attention(attn_input, self._num_hidden_unit//2) # [T*N, 1 + num_external_categories, D]
 
-                        agg_output = MLP(dense_inputs.get_shape()[-1].value, tf.reshape(tf.reduce_mean(attn_output, axis=-2, keepdims=True), [-1, self._num_node, 1, self._num_hidden_unit//2]))
+                        agg_output = MLP(dense_dim, tf.reshape(tf.reduce_mean(attn_output, axis=-2, keepdims=True), [-1, self._num_node, 1, self._num_hidden_unit//2]))
                         
                         dense_inputs = tf.add(dense_inputs, agg_output)
                         
@@ -568,17 +606,15 @@ class STMeta(BaseModel):
                                                   use_bias=True,
                                                   kernel_initializer='glorot_uniform',
                                                   bias_initializer='zeros',
-                                                  kernel_regularizer=tf.keras.regularizers.l2(0.01),
-                                                  bias_regularizer=tf.keras.regularizers.l2(0.01)
+                                                  kernel_regularizer=l2_regularizer
                                                   )(dense_inputs)
 
             dense_output1 = tf.keras.layers.Dense(units=self._num_dense_units,
-                                                  activation=tf.nn.tanh,
+                                                  activation=tf.nn.relu,
                                                   use_bias=True,
                                                   kernel_initializer='glorot_uniform',
                                                   bias_initializer='zeros',
-                                                  kernel_regularizer=tf.keras.regularizers.l2(0.01),
-                                                  bias_regularizer=tf.keras.regularizers.l2(0.01)
+                                                  kernel_regularizer=l2_regularizer
                                                   )(dense_output0)
 
             pre_output = tf.keras.layers.Dense(units=1,
@@ -586,8 +622,7 @@ class STMeta(BaseModel):
                                                use_bias=True,
                                                kernel_initializer='glorot_uniform',
                                                bias_initializer='zeros',
-                                               kernel_regularizer=tf.keras.regularizers.l2(0.01),
-                                               bias_regularizer=tf.keras.regularizers.l2(0.01)
+                                               kernel_regularizer=l2_regularizer
                                                )(dense_output1)
 
             prediction = tf.reshape(pre_output, [-1, self._num_node, 1], name='prediction')
@@ -606,6 +641,13 @@ class STMeta(BaseModel):
             # record train operation
             self._op['train_op'] = train_op.name
 
+        if self._mixed_precision:
+            # turn on the float16 graph rewrite for the session of this model only, unlike
+            # tf.train.experimental.enable_mixed_precision_graph_rewrite, which affects every later session
+            self._config.graph_options.rewrite_options.auto_mixed_precision = rewriter_config_pb2.RewriterConfig.ON
+            self._session.close()
+            self._session = tf.Session(graph=self._graph, config=self._config)
+
         super(STMeta, self).build(init_vars, max_to_keep)
     
     # Define your '_get_feed_dict function‘, map your input to the tf-model
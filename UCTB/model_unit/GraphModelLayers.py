@@ -2,7 +2,6 @@ import numpy as np
 import tensorflow as tf
 
 from math import radians, cos, sin, asin, sqrt
-from scipy.stats import pearsonr
 
 
 class GraphBuilder(object):
@@ -28,7 +27,7 @@ class GraphBuilder(object):
         return c * r * 1000
 
     @staticmethod
-    def correlation_adjacent(traffic_data, threshold):
+    def correlation_adjacent(traffic_data, threshold, block_size=1024):
         '''
         Calculate correlation graph based on pearson coefficient.
 
@@ -36,13 +35,22 @@ class GraphBuilder(object):
             traffic_data(ndarray): numpy array with shape [sequence_length, num_node].
             threshold(float): float between [-1, 1], nodes with Pearson Correlation coefficient
                 larger than this threshold will be linked together.
+            block_size(int): number of nodes whose coefficients are computed at once, which bounds
+                the temporary memory to [block_size, num_node]. Default: 1024
         '''
-        adjacent_matrix = np.zeros([traffic_data.shape[1], traffic_data.shape[1]])
-        for i in range(traffic_data.shape[1]):
-            for j in range(traffic_data.shape[1]):
-                r, p_value = pearsonr(traffic_data[:, i], traffic_data[:, j])
-                adjacent_matrix[i, j] = 0 if np.isnan(r) else r
-        adjacent_matrix = (adjacent_matrix >= threshold).astype(np.float32)
+        # standardize every node once, pearson coefficients are then computed block by block with matmul.
+        # constant series have an undefined coefficient and are treated as 0
+        traffic_data = np.asarray(traffic_data, dtype=np.float64)
+        traffic_data = traffic_data - np.mean(traffic_data, axis=0, keepdims=True)
+        norm = np.linalg.norm(traffic_data, axis=0)
+        norm[norm == 0] = 1
+        traffic_data = traffic_data / norm
+
+        num_node = traffic_data.shape[1]
+        adjacent_matrix = np.zeros([num_node, num_node], dtype=np.float32)
+        for i in range(0, num_node, block_size):
+            r = np.dot(traffic_data[:, i:i + block_size].transpose(), traffic_data)
+            adjacent_matrix[i:i + block_size] = r >= threshold
         return adjacent_matrix
 
     @staticmethod
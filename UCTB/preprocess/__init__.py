@@ -1,2 +1,2 @@
 from .preprocessor import Normalizer, SplitData, MoveSample, ST_MoveSample
-from .time_utils import is_valid_date, is_work_day_america, is_work_day_china
\ No newline at end of file
+from .time_utils import is_valid_date, is_work_day_america, is_work_day_china, slot_hour_and_weekday
\ No newline at end of file
@@ -1,6 +1,8 @@
 import numpy as np
 import torch
 
+from numpy.lib.stride_tricks import as_strided
+
 class Normalizer(object):
     '''
     This class can help normalize and denormalize data by calling min_max_normal and min_max_denormal method.
@@ -35,16 +37,25 @@ class MoveSample(object):
         self.target_length = target_length
 
     def general_move_sample(self, data):
-        feature = []
-        target = []
-        for i in range(len(data) - self.feature_length -
-                       (self.feature_step-1)*self.feature_stride - self.target_length + 1):
-            feature.append([data[i + step*self.feature_stride: i + step*self.feature_stride + self.feature_length]
-                            for step in range(self.feature_step)])
-            target.append(data[i + (self.feature_step-1) * self.feature_stride + self.feature_length:\
-                               i + (self.feature_step-1) * self.feature_stride + self.feature_length + self.target_length])
-
-        return np.array(feature), np.array(target)
+        '''
+        Cut ``data`` into sliding windows. The feature has shape [sample_num, feature_step, feature_length, ...]
+        and the target has shape [sample_num, target_length, ...]. Both are read-only strided views of ``data``,
+        call ``.copy()`` before modifying them.
+        '''
+        data = np.asarray(data)
+        sample_num = len(data) - self.feature_length - (self.feature_step-1)*self.feature_stride - self.target_length + 1
+        if sample_num <= 0:
+            return np.array([]), np.array([])
+
+        row_stride = data.strides[0]
+        feature = as_strided(data, shape=(sample_num, self.feature_step, self.feature_length) + data.shape[1:],
+                             strides=(row_stride, row_stride * self.feature_stride, row_stride) + data.strides[1:],
+                             writeable=False)
+        target = as_strided(data[(self.feature_step-1) * self.feature_stride + self.feature_length:],
+                            shape=(sample_num, self.target_length) + data.shape[1:],
+                            strides=(row_stride, row_stride) + data.strides[1:], writeable=False)
+
+        return feature, target
 
 
 class ST_MoveSample(object):
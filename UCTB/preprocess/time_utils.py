@@ -1,3 +1,5 @@
+import numpy as np
+
 from dateutil.parser import parse
 from chinese_calendar import is_workday
 from workalendar.oceania import Australia
@@ -53,6 +55,23 @@ def is_work_day_australia(date):
     cal = Australia()
     return cal.is_working_day(date)
 
+def slot_hour_and_weekday(start_time, slot_minutes, slot_num):
+    """
+    Args:
+        start_time(datetime): Time of the first time slot, e.g. datetime(2019, 1, 1)
+        slot_minutes(int): Length of a time slot in minutes.
+        slot_num(int): Number of time slots.
+
+    Return:
+        Two int8 ndarrays with shape [slot_num], the hour of day and the day of week
+        (Monday is 0) of every time slot, computed with integer arithmetic.
+    """
+    minutes = start_time.hour * 60 + start_time.minute + np.arange(slot_num, dtype=np.int64) * int(slot_minutes)
+    hour = (minutes // 60 % 24).astype(np.int8)
+    weekday = ((start_time.weekday() + minutes // (24 * 60)) % 7).astype(np.int8)
+    return hour, weekday
+
+
 def is_valid_date(date_str):
     """
     Args:
@@ -4,7 +4,12 @@ import yaml
 
 
 class Optimizer(object):
-    def __init__(self, decay_param=None, lr=None):
+    def __init__(self, decay_param=None, lr=None, mixed_precision=False):
+        if mixed_precision and not hasattr(getattr(tf.train, 'experimental', None),
+                                           'MixedPrecisionLossScaleOptimizer'):
+            raise ValueError('mixed_precision requires TensorFlow 1.14 or later, found TensorFlow {}'.format(
+                tf.__version__))
+        self._mixed_precision = mixed_precision
         # if not specified, naive method
         if decay_param is None:
             self._decay_func = None
@@ -35,6 +40,11 @@ class Optimizer(object):
             else:
                 raise KeyError(
                     "decay_func is not defined, see the doc for help.")
-            return tf.train.AdamOptimizer(learning_rate).minimize(loss_pre, name='train_op'), global_step.name, learning_rate.name
+            optimizer = tf.train.AdamOptimizer(learning_rate)
+            if self._mixed_precision:
+                # dynamic loss scaling keeps the float16 gradients from underflowing, the float16 rewrite itself is
+                # turned on in the config of the model session
+                optimizer = tf.train.experimental.MixedPrecisionLossScaleOptimizer(optimizer, 'dynamic')
+            return optimizer.minimize(loss_pre, name='train_op'), global_step.name, learning_rate.name
         except Exception as e:
             raise KeyError("Decay learning param error. Check param files.\n"+e)
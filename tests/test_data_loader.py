@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+# importing UCTB loads the whole toolbox, including the TF models
+for module in ['pandas', 'torch', 'tensorflow', 'keras']:
+    pytest.importorskip(module)
+
+from UCTB.dataset import NodeTrafficLoader, TransferDataLoader
+
+
+def make_loader(time_slots=20, station_number=5, closeness_len=3, period_len=2, trend_len=0):
+    loader = NodeTrafficLoader.__new__(NodeTrafficLoader)
+    loader.station_number = station_number
+    loader.closeness_len = closeness_len
+    loader.period_len = period_len
+    loader.trend_len = trend_len
+    loader.train_y = np.random.rand(time_slots, station_number, 1)
+    loader.train_closeness = np.random.rand(time_slots, station_number, closeness_len, 1)
+    loader.train_period = np.random.rand(time_slots, station_number, period_len, 1)
+    loader.train_trend = np.random.rand(time_slots, station_number, trend_len, 1)
+    return loader
+
+
+def test_make_concat_all_nodes():
+    loader = make_loader()
+    history = loader.make_concat()
+    assert history.shape == (20, 5, 5, 1)
+    np.testing.assert_array_equal(history[:, :, :3], loader.train_closeness)
+    np.testing.assert_array_equal(history[:, :, 3:], loader.train_period)
+
+
+@pytest.mark.parametrize('node', [0, 2, 4, -1])
+def test_make_concat_single_node(node):
+    loader = make_loader()
+    history = loader.make_concat(node=node)
+    assert history.shape == (20, 1, 5, 1)
+    np.testing.assert_array_equal(history[:, 0], loader.make_concat()[:, node])
+
+
+def test_make_concat_without_history():
+    loader = make_loader(closeness_len=0, period_len=0)
+    assert loader.make_concat(node=1).shape == (20, 1, 0, 1)
+
+
+def loop_traffic_sim(td_data, sd_data, stride):
+    # the window by window loop TransferDataLoader.traffic_sim used before the windows were batched
+    similar_record = []
+    for i in range(0, sd_data.shape[0] - td_data.shape[0], stride):
+        td = td_data.transpose()
+        sd = sd_data[i:i + td_data.shape[0]].transpose()
+        td = td / np.maximum(np.linalg.norm(td, axis=1, keepdims=True), 1e-12)
+        sd = sd / np.maximum(np.linalg.norm(sd, axis=1, keepdims=True), 1e-12)
+        sim = np.dot(td, sd.transpose())
+
+        max_sim, max_index = np.max(sim, axis=1), np.argmax(sim, axis=1)
+
+        if len(similar_record) == 0:
+            similar_record = [[max_sim[e], max_index[e], i, i + td_data.shape[0]] for e in range(len(max_sim))]
+        else:
+            for index in range(len(similar_record)):
+                if similar_record[index][0] < max_sim[index]:
+                    similar_record[index] = [max_sim[index], max_index[index], i, i + td_data.shape[0]]
+
+    return similar_record
+
+
+@pytest.mark.parametrize('stride, chunk_elements', [(24, 2 ** 25), (24, 1), (5, 2 ** 25), (1, 2000)])
+def test_sliding_traffic_sim_matches_loop(stride, chunk_elements):
+    random_state = np.random.RandomState(0)
+    td_data = random_state.rand(48, 6)
+    sd_data = random_state.rand(24 * 20, 9)
+    sd_data[:, 3] = 0
+    record = TransferDataLoader._sliding_traffic_sim(td_data, sd_data, stride, chunk_elements=chunk_elements)
+    loop_record = np.array(loop_traffic_sim(td_data, sd_data, stride))
+    np.testing.assert_allclose(record['sim'], loop_record[:, 0], rtol=1e-5)
+    np.testing.assert_array_equal(record['index'], loop_record[:, 1])
+    np.testing.assert_array_equal(record['start'], loop_record[:, 2])
+    np.testing.assert_array_equal(record['end'], loop_record[:, 3])
+
+
+def test_sliding_traffic_sim_without_windows():
+    record = TransferDataLoader._sliding_traffic_sim(np.random.rand(48, 6), np.random.rand(48, 9), 24)
+    assert len(record) == 0
+    assert record.dtype.names == ('sim', 'index', 'start', 'end')
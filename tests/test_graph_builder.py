@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+# importing UCTB loads the whole toolbox, including the TF models
+for module in ['pandas', 'torch', 'tensorflow', 'keras']:
+    pytest.importorskip(module)
+
+from UCTB.model_unit import GraphBuilder
+
+
+def loop_correlation_adjacent(traffic_data, threshold):
+    # the pairwise implementation GraphBuilder.correlation_adjacent used before the blocked matmul
+    adjacent_matrix = np.zeros([traffic_data.shape[1], traffic_data.shape[1]])
+    for i in range(traffic_data.shape[1]):
+        for j in range(traffic_data.shape[1]):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                r = np.corrcoef(traffic_data[:, i], traffic_data[:, j])[0, 1]
+            adjacent_matrix[i, j] = 0 if np.isnan(r) else r
+    adjacent_matrix = (adjacent_matrix >= threshold).astype(np.float32)
+    return adjacent_matrix
+
+
+@pytest.mark.parametrize('threshold, block_size', [(0, 1024), (0.1, 1024), (-0.2, 3), (0.1, 1), (0.5, 4)])
+def test_correlation_adjacent_matches_loop(threshold, block_size):
+    random_state = np.random.RandomState(0)
+    traffic_data = random_state.rand(200, 10)
+    traffic_data[:, 7] = traffic_data[:, 2] * 3 + 1
+    traffic_data[:, 4] = 5
+    adjacent_matrix = GraphBuilder.correlation_adjacent(traffic_data, threshold, block_size=block_size)
+    assert adjacent_matrix.dtype == np.float32
+    np.testing.assert_array_equal(adjacent_matrix, loop_correlation_adjacent(traffic_data, threshold))
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+# importing UCTB loads the whole toolbox, including the TF models
+for module in ['pandas', 'torch', 'tensorflow', 'keras']:
+    pytest.importorskip(module)
+
+from UCTB.preprocess import MoveSample, ST_MoveSample
+
+
+class LoopMoveSample(MoveSample):
+    # the list based implementation MoveSample used before it returned strided views
+    def general_move_sample(self, data):
+        feature = []
+        target = []
+        for i in range(len(data) - self.feature_length -
+                       (self.feature_step-1)*self.feature_stride - self.target_length + 1):
+            feature.append([data[i + step*self.feature_stride: i + step*self.feature_stride + self.feature_length]
+                            for step in range(self.feature_step)])
+            target.append(data[i + (self.feature_step-1) * self.feature_stride + self.feature_length:
+                               i + (self.feature_step-1) * self.feature_stride + self.feature_length + self.target_length])
+
+        return np.array(feature), np.array(target)
+
+
+def loop_st_move_sample(closeness_len, period_len, trend_len, target_length, daily_slots):
+    st_move_sample = ST_MoveSample(closeness_len, period_len, trend_len, target_length, daily_slots)
+    for name in ['move_sample_closeness', 'move_sample_period', 'move_sample_trend']:
+        move_sample = getattr(st_move_sample, name)
+        setattr(st_move_sample, name, LoopMoveSample(move_sample.feature_step, move_sample.feature_stride,
+                                                     move_sample.feature_length, move_sample.target_length))
+    return st_move_sample
+
+
+@pytest.mark.parametrize('feature_step, feature_stride, feature_length, target_length', [
+    (6, 1, 1, 1), (8, 24, 1, 0), (5, 168, 1, 0), (3, 2, 4, 2), (1, 1, 1, 0)])
+def test_move_sample_matches_loop(feature_step, feature_stride, feature_length, target_length):
+    data = np.random.rand(800, 5, 2)
+    feature, target = MoveSample(feature_step, feature_stride, feature_length,
+                                 target_length).general_move_sample(data)
+    loop_feature, loop_target = LoopMoveSample(feature_step, feature_stride, feature_length,
+                                               target_length).general_move_sample(data)
+    np.testing.assert_array_equal(feature, loop_feature)
+    np.testing.assert_array_equal(target, loop_target)
+
+
+def test_move_sample_too_short():
+    feature, target = MoveSample(8, 24, 1, 0).general_move_sample(np.random.rand(100, 5))
+    assert feature.shape == (0,)
+    assert target.shape == (0,)
+
+
+def test_move_sample_is_read_only():
+    feature, target = MoveSample(3, 1, 1, 1).general_move_sample(np.random.rand(10, 5))
+    with pytest.raises(ValueError):
+        feature[0, 0, 0, 0] = 0
+    with pytest.raises(ValueError):
+        target[0, 0, 0] = 0
+
+
+@pytest.mark.parametrize('closeness_len, period_len, trend_len, daily_slots', [
+    (6, 7, 4, 24), (6, 0, 0, 24), (0, 3, 0, 12), (3, 2, 1, 12), (6, 7, 0, 48)])
+def test_st_move_sample_matches_loop(closeness_len, period_len, trend_len, daily_slots):
+    data = np.random.rand(daily_slots * 7 * 5 + 13, 4)
+    args = (closeness_len, period_len, trend_len, 1, daily_slots)
+    result = ST_MoveSample(*args).move_sample(data)
+    loop_result = loop_st_move_sample(*args).move_sample(data)
+    for array, loop_array in zip(result, loop_result):
+        assert array.shape == loop_array.shape
+        np.testing.assert_array_equal(array, loop_array)
+